@@ -9,40 +9,115 @@ Configuration (priority: .env > system environment variables > defaults):
     GEMINI_API_KEY: Your Gemini API key (required)
     GEMINI_BASE_URL: Custom base URL for API endpoint (optional)
     GEMINI_MODEL: Model name for image generation (default: gemini-3-pro-image-preview)
+    GEMINI_CONCURRENCY: Max concurrent requests in batch mode (default: 8)
+    GEMINI_RPM: Max requests started per minute in batch mode (default: 20)
+    GEMINI_TIMEOUT: Request timeout in seconds (default: 300)
 
 Usage:
     python generate_image.py --prompt-json '<json_string>' [--input-images <path1> <path2> ...]
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import json
 import argparse
+import asyncio
+import collections
+import functools
+import hashlib
+import importlib.util
+import io
+import math
+import mimetypes
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
 
-try:
+if TYPE_CHECKING:
     from google import genai
     from google.genai import types
-except ImportError:
-    print("Error: google-genai package not installed.")
-    print("Please install with: pip install -q -U google-genai")
-    sys.exit(1)
 
+# orjson is optional; it parses and serializes JSON considerably faster than the stdlib
 try:
-    from PIL import Image
+    import orjson
+    _loads = orjson.loads
 except ImportError:
-    print("Error: Pillow package not installed.")
-    print("Please install with: pip install Pillow")
-    sys.exit(1)
+    orjson = None
+    _loads = json.loads
 
-try:
-    from dotenv import load_dotenv
-except ImportError:
-    print("Error: python-dotenv package not installed.")
-    print("Please install with: pip install python-dotenv")
-    sys.exit(1)
+_PROMPT_SCHEMA_PATH = Path(__file__).parent / "prompt_schema.json"
+
+
+def _has_non_finite(obj: object) -> bool:
+    """Whether a JSON-like object contains a NaN or infinite float anywhere."""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(v) for v in obj)
+    return False
+
+
+def _dumps_canonical(obj: object) -> bytes:
+    """
+    Serialize obj as canonical (sorted-key) JSON bytes, used for cache keys.
+
+    orjson writes NaN and infinities as null and rejects integers beyond
+    64 bits, so such objects go through the stdlib instead, keeping keys
+    of distinct objects distinct.
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+        else:
+            # Output without "null" cannot hold a non-finite float; otherwise check the object itself
+            if b"null" not in data or not _has_non_finite(obj):
+                return data
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+@functools.cache
+def _import_genai():
+    """
+    Import google-genai on first use.
+
+    The SDK takes around half a second to import, which --help, argument
+    errors and prompt validation would otherwise pay for nothing.
+
+    Returns:
+        Tuple of the (genai, types) modules
+    """
+    try:
+        from google import genai
+        from google.genai import types
+    except ImportError:
+        print("Error: google-genai package not installed.")
+        print("Please install with: pip install -q -U google-genai")
+        sys.exit(1)
+    return genai, types
+
+
+@functools.cache
+def _dotenv_values() -> dict[str, Optional[str]]:
+    """Parse the skill's .env file once per process, without touching os.environ."""
+    try:
+        from dotenv import dotenv_values
+    except ImportError:
+        print("Error: python-dotenv package not installed.")
+        print("Please install with: pip install python-dotenv")
+        sys.exit(1)
+
+    env_path = Path(__file__).parent.parent / ".env"
+    return dotenv_values(env_path)
 
 
 def get_env_value(key: str, default: Optional[str] = None) -> Optional[str]:
@@ -56,18 +131,28 @@ def get_env_value(key: str, default: Optional[str] = None) -> Optional[str]:
     Returns:
         The value from the highest priority source
     """
-    # Load .env file (overrides system env if set)
-    env_path = Path(__file__).parent.parent / ".env"
-    load_dotenv(env_path, override=True)
+    value = _dotenv_values().get(key)
+    if value is None:
+        value = os.environ.get(key, default)
+    return value
+
 
-    # Check .env first (already loaded to os.environ)
-    value = os.environ.get(key)
+@functools.cache
+def _get_model_name() -> str:
+    """Get model name from config (priority: .env > system env > default)."""
+    return get_env_value("GEMINI_MODEL", "gemini-3-pro-image-preview")
 
-    return value if value is not None else default
 
+def reset_config_cache() -> None:
+    """Forget the cached .env values, client and model name so they are re-read on next use."""
+    _dotenv_values.cache_clear()
+    _get_model_name.cache_clear()
+    get_client.cache_clear()
 
+
+@functools.cache
 def get_client() -> genai.Client:
-    """Initialize Gemini client with environment configuration."""
+    """Initialize Gemini client with environment configuration (created once per process)."""
     api_key = get_env_value("GEMINI_API_KEY")
     base_url = get_env_value("GEMINI_BASE_URL")
 
@@ -75,476 +160,1019 @@ def get_client() -> genai.Client:
         print("Error: GEMINI_API_KEY environment variable is not set.")
         sys.exit(1)
 
-    client_kwargs = {"api_key": api_key}
+    genai, types = _import_genai()
+    import httpx  # installed with google-genai
+
+    # The client keeps one connection pool for the whole process; with the
+    # optional h2 package, concurrent batch requests also share one HTTP/2
+    # connection instead of opening a TLS session each
+    pool_args = {"limits": httpx.Limits(max_connections=32, max_keepalive_connections=16)}
+    if importlib.util.find_spec("h2") is not None:
+        pool_args["http2"] = True
+
+    http_options = types.HttpOptions(
+        base_url=base_url,  # Custom base URL if provided
+        timeout=_get_int_env_value("GEMINI_TIMEOUT", 300) * 1000,  # milliseconds
+        client_args=dict(pool_args),
+        async_client_args=dict(pool_args)
+    )
+
+    return genai.Client(api_key=api_key, http_options=http_options)
 
-    if base_url:
-        # Configure custom base URL if provided
-        client_kwargs["http_options"] = types.HttpOptions(base_url=base_url)
 
-    return genai.Client(**client_kwargs)
+def _read_input_image(path: str) -> tuple[Optional[types.Part], str]:
+    """Read one input image as a bytes Part (None if it cannot be read) plus a status message."""
+    mime_type = mimetypes.guess_type(path)[0]
+    if mime_type is None or not mime_type.startswith("image/"):
+        # The API would reject the whole request, so skip files that are not images
+        return None, f"Warning: Failed to load image {path}: not a recognized image type ({mime_type or 'unknown'})"
+    try:
+        data = Path(path).read_bytes()
+    except Exception as e:
+        return None, f"Warning: Failed to load image {path}: {e}"
 
+    # Import the SDK only after reading, so the read overlaps with its import in get_client()
+    _, types = _import_genai()
+    return types.Part.from_bytes(data=data, mime_type=mime_type), f"Loaded input image: {path}"
 
-def load_input_images(image_paths: list[str]) -> list:
-    """Load input images for image-to-image generation."""
-    images = []
-    for path in image_paths:
-        try:
-            img = Image.open(path)
-            images.append(img)
-            print(f"Loaded input image: {path}")
-        except Exception as e:
-            print(f"Warning: Failed to load image {path}: {e}")
-    return images
+
+def load_input_images(image_paths: list[str]) -> list[types.Part]:
+    """
+    Load input images for image-to-image generation.
+
+    The files are passed through to the API as their original encoded
+    bytes instead of being decoded and re-encoded via PIL. Multiple files
+    are read concurrently.
+    """
+    if len(image_paths) <= 1:
+        results = [_read_input_image(path) for path in image_paths]
+    else:
+        # Same sizing as ThreadPoolExecutor's default, without spawning idle workers
+        max_workers = min(len(image_paths), (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_read_input_image, image_paths))
+
+    if results:
+        print("\n".join(message for _, message in results))
+    return [part for part, _ in results if part is not None]
+
+
+async def load_input_images_async(image_paths: list[str]) -> list[types.Part]:
+    """
+    Load input images for image-to-image generation without blocking the event loop.
+
+    Async counterpart of load_input_images for the batch path: every file is
+    read in a worker thread via asyncio.to_thread, all of them concurrently.
+    """
+    results = await asyncio.gather(*(asyncio.to_thread(_read_input_image, path) for path in image_paths))
+
+    if results:
+        print("\n".join(message for _, message in results))
+    return [part for part, _ in results if part is not None]
+
+
+@functools.cache
+def _get_prompt_validator() -> Optional[Callable[[dict], None]]:
+    """
+    Compile the prompt JSON schema once; returns None if no validator library is installed.
+
+    Validation is optional: fastjsonschema compiles the schema to Python code,
+    jsonschema is only imported as a fallback, and validation is skipped
+    without either.
+    """
+    try:
+        import fastjsonschema
+    except ImportError:
+        fastjsonschema = None
+
+    if fastjsonschema is not None:
+        return fastjsonschema.compile(_loads(_PROMPT_SCHEMA_PATH.read_bytes()))
+
+    try:
+        import jsonschema
+    except ImportError:
+        return None
+
+    schema = _loads(_PROMPT_SCHEMA_PATH.read_bytes())
+    validator = jsonschema.validators.validator_for(schema)(schema)
+    return validator.validate
+
+
+def validate_prompt_json(prompt_json: dict) -> Optional[str]:
+    """
+    Validate a structured prompt against scripts/prompt_schema.json.
+
+    Args:
+        prompt_json: Structured JSON prompt
+
+    Returns:
+        An error message if the prompt is invalid, otherwise None
+    """
+    validate = _get_prompt_validator()
+    if validate is None:
+        return None
+
+    try:
+        validate(prompt_json)
+    except Exception as e:
+        # fastjsonschema messages already name the field; jsonschema exposes it as json_path
+        message = getattr(e, "message", str(e))
+        path = getattr(e, "json_path", None)
+        return f"{path}: {message}" if path else message
+    return None
+
+
+# Local map of input image hashes to live Gemini context caches
+_CACHE_MAP_PATH = Path.home() / ".cache" / "gemini-skill" / "cache_map.json"
+_CACHE_TTL_SECONDS = 3600
+
+# Real-time web search tool attached to every generation request
+_GOOGLE_SEARCH_TOOL = {"google_search": {}}
+
+
+def _load_cache_map() -> dict:
+    """Read the local input cache map (empty if missing or unreadable)."""
+    try:
+        return json.loads(_CACHE_MAP_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache_map(cache_map: dict) -> None:
+    """Write the local input cache map, warning if that fails."""
+    try:
+        _CACHE_MAP_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _CACHE_MAP_PATH.write_text(json.dumps(cache_map), encoding="utf-8")
+    except OSError as e:
+        print(f"Warning: Failed to save input cache map: {e}")
+
+
+def get_cached_inputs(client: genai.Client, input_images: list[types.Part], model: str) -> Optional[str]:
+    """
+    Get a Gemini context cache holding the input images, creating it if needed.
+
+    Caches are looked up in a local map by a hash of the endpoint, API key,
+    model name and image bytes (caches belong to one project), so repeated
+    runs with the same input images skip re-uploading them until the cache
+    expires.
+
+    Args:
+        client: Gemini client instance
+        input_images: Image Parts to cache, in prompt order
+        model: Model the cache is created for
+
+    Returns:
+        The cache name, or None if the cache could not be created
+    """
+    digest = hashlib.sha256()
+    for value in (get_env_value("GEMINI_BASE_URL") or "", get_env_value("GEMINI_API_KEY") or "", model):
+        digest.update(hashlib.sha256(value.encode()).digest())
+    for part in input_images:
+        digest.update(hashlib.sha256(part.inline_data.data).digest())
+    key = digest.hexdigest()
+
+    cache_map = _load_cache_map()
+
+    # Keep a minute of headroom so the cache does not expire mid-request
+    now = time.time()
+    entry = cache_map.get(key)
+    if entry and entry.get("expires", 0) > now + 60:
+        print(f"Reusing cached input images: {entry['name']}")
+        return entry["name"]
+
+    _, types = _import_genai()
+    try:
+        # Requests using cached content may not set tools, so they live in the cache
+        cache = client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[types.Content(role="user", parts=input_images)],
+                tools=[_GOOGLE_SEARCH_TOOL],
+                ttl=f"{_CACHE_TTL_SECONDS}s"
+            )
+        )
+    except Exception as e:
+        print(f"Warning: Failed to cache input images, sending them inline: {e}")
+        return None
+
+    expires = cache.expire_time.timestamp() if cache.expire_time else now + _CACHE_TTL_SECONDS
+    cache_map = {k: v for k, v in cache_map.items() if v.get("expires", 0) > now}
+    cache_map[key] = {"name": cache.name, "expires": expires}
+    _save_cache_map(cache_map)
+
+    print(f"Cached input images: {cache.name}")
+    return cache.name
+
+
+def _is_stale_cache_error(exc: BaseException) -> bool:
+    """Whether a request failed because its context cache is gone or belongs to another project."""
+    genai, _ = _import_genai()
+    return isinstance(exc, genai.errors.APIError) and exc.code in (403, 404)
+
+
+def _forget_cached_inputs(cached_content: str) -> None:
+    """Drop a context cache the server no longer serves from the local map."""
+    cache_map = _load_cache_map()
+    remaining = {k: v for k, v in cache_map.items() if v.get("name") != cached_content}
+    if len(remaining) != len(cache_map):
+        _save_cache_map(remaining)
+
+
+# A rendered prompt line: (label, separator, tokens); label None means no "label: " prefix
+_Section = tuple[Optional[str], str, list[str]]
+
+# For UI design, exclude device frames, monitors, screens to get pure UI
+_UI_EXCLUDES = (
+    "monitor", "computer screen", "device frame", "laptop", "phone frame", "tablet frame",
+    "display bezel", "physical device", "realistic device rendering", "photograph of screen",
+)
+
+# For graphic design, exclude photorealistic elements if using illustration quality
+_ILLUSTRATION_QUALITIES = frozenset({"vector_illustration", "flat_illustration"})
+_GD_ILLUSTRATION_EXCLUDES = ("photorealistic", "realistic lighting", "camera effects", "depth of field", "bokeh")
+
+
+# Rendered prompt texts keyed by canonical JSON, bounded for long-running callers
+_PROMPT_TEXT_CACHE: dict[bytes, str] = {}
+_PROMPT_TEXT_CACHE_SIZE = 256
+_PROMPT_TEXT_CACHE_LOCK = threading.Lock()
 
 
 def build_prompt_text(prompt_json: dict) -> str:
     """
     Convert structured JSON prompt to natural language prompt.
     Supports three domains: photography, graphic_design, ui_design
+
+    A non-empty top-level "prompt_text" string is a finished prompt and is
+    returned as-is, without rendering any other section ("meta" still sets
+    the image configuration).
+
+    Results are cached by the prompt's canonical JSON, so repeated prompts
+    (e.g. in batch mode) are only rendered once.
     """
-    parts = []
+    raw = prompt_json.get("prompt_text")
+    if isinstance(raw, str) and raw:
+        return raw
 
+    try:
+        key = _dumps_canonical(prompt_json)
+    except (TypeError, ValueError):
+        # Not JSON serializable, so it cannot be cached; render it directly
+        return _render_prompt_text(prompt_json)
+
+    text = _PROMPT_TEXT_CACHE.get(key)
+    if text is None:
+        text = _render_prompt_text(prompt_json)
+        with _PROMPT_TEXT_CACHE_LOCK:
+            if len(_PROMPT_TEXT_CACHE) >= _PROMPT_TEXT_CACHE_SIZE:
+                # Evict the oldest entry (dicts keep insertion order)
+                del _PROMPT_TEXT_CACHE[next(iter(_PROMPT_TEXT_CACHE))]
+            _PROMPT_TEXT_CACHE[key] = text
+    return text
+
+
+def _render_prompt_text(prompt_json: dict) -> str:
+    """Render the prompt text of a JSON prompt, one line per section."""
+    buf = io.StringIO()
+    for label, sep, tokens in _iter_prompt_sections(prompt_json):
+        if label is not None:
+            buf.write(label)
+            buf.write(": ")
+        buf.write(sep.join(tokens))
+        buf.write("\n")
+    # Drop only the final line break, keeping any trailing newline of the content itself
+    return buf.getvalue()[:-1]
+
+
+def _iter_prompt_sections(prompt_json: dict) -> Iterator[_Section]:
+    """Yield the ``(label, sep, tokens)`` sections of the prompt in output order."""
     # User intent
-    if "user_intent" in prompt_json:
-        parts.append(prompt_json["user_intent"])
+    yield from _iter_sections(_INTENT_SECTIONS, prompt_json)
 
     # Get domain, default to photography
     meta = prompt_json.get("meta", {})
     domain = meta.get("domain", "photography")
 
     # Quality (shared by all domains)
-    if "quality" in meta:
-        parts.append(f"Style: {meta['quality'].replace('_', ' ')}")
+    yield from _iter_sections(_META_SECTIONS, meta)
 
-    # Domain-specific rendering
-    if domain == "graphic_design":
-        parts.extend(_build_graphic_design_prompt(prompt_json))
-    elif domain == "ui_design":
-        parts.extend(_build_ui_design_prompt(prompt_json))
-    else:  # photography (default)
-        parts.extend(_build_photography_prompt(prompt_json))
+    # Domain-specific rendering (photography is the fallback)
+    yield from _DOMAIN_BUILDERS.get(domain, _build_photography_prompt)(prompt_json)
 
     # Style modifiers (shared by all domains)
-    if "style_modifiers" in prompt_json:
-        style_parts = _build_style_modifiers(prompt_json["style_modifiers"])
-        if style_parts:
-            parts.append(style_parts)
+    yield from _iter_sections(_STYLE_MODIFIERS_SECTIONS, prompt_json)
 
     # Negative prompt
     negative_items = []
-    if "advanced" in prompt_json and "negative_prompt" in prompt_json["advanced"]:
-        negative_items.extend(prompt_json["advanced"]["negative_prompt"])
+    advanced = prompt_json.get("advanced")
+    if advanced:
+        negative_prompt = advanced.get("negative_prompt")
+        if negative_prompt is not None:
+            negative_items.extend(negative_prompt)
 
     # Domain-specific automatic negative prompts
-    if domain == "ui_design":
-        # For UI design, exclude device frames, monitors, screens to get pure UI
-        ui_excludes = ["monitor", "computer screen", "device frame", "laptop", "phone frame", "tablet frame", "display bezel", "physical device", "realistic device rendering", "photograph of screen"]
-        negative_items.extend(ui_excludes)
-    elif domain == "graphic_design":
-        # For graphic design, exclude photorealistic elements if using illustration quality
-        if meta.get("quality") in ["vector_illustration", "flat_illustration"]:
-            gd_excludes = ["photorealistic", "realistic lighting", "camera effects", "depth of field", "bokeh"]
-            negative_items.extend(gd_excludes)
+    augmenter = _NEGATIVE_AUGMENTERS.get(domain)
+    if augmenter is not None:
+        negative_items.extend(augmenter(meta))
 
     if negative_items:
-        parts.append(f"Avoid: {', '.join(negative_items)}")
+        yield "Avoid", ", ", negative_items
+
+
+# Translation table mapping "_" to " " for snake_case schema values
+_U2S = str.maketrans("_", " ")
+
+
+def _despace(value: str) -> str:
+    """Turn snake_case schema values into readable words."""
+    # Values that are already space separated skip the translate call entirely
+    return value.translate(_U2S) if "_" in value else value
+
+
+def _despace_unless_none(value: str) -> Optional[str]:
+    """Like _despace, but drop the literal "none" option."""
+    return None if value == "none" else _despace(value)
+
+
+def _unless_default(value: str) -> Optional[str]:
+    """Drop the literal "default" option."""
+    return None if value == "default" else value
+
+
+def _join_despaced(values: list[str]) -> str:
+    """Join a list of snake_case values into a comma separated phrase."""
+    return ", ".join(_despace(v) for v in values)
+
+
+def _render(spec: tuple, src: dict, out: list[str]) -> list[str]:
+    """
+    Render the fields of a JSON section using a declarative spec.
+
+    Each spec entry is ``(key, template, transform)``. Missing keys are
+    skipped, as are fields whose transform returns None.
+
+    Args:
+        spec: Tuple of (key, template, transform) entries, in output order
+        src: JSON section to read the fields from
+        out: List the formatted field descriptions are appended to
+
+    Returns:
+        The ``out`` list
+    """
+    for key, template, transform in spec:
+        value = src.get(key)
+        if value is not None and transform is not None:
+            value = transform(value)
+        if value is not None:
+            out.append(template.format(value))
+    return out
+
+
+def _join_fields(spec: tuple, sep: str = ", ") -> Callable[[dict], Optional[str]]:
+    """Build a transform rendering a nested section through ``spec``."""
+    def transform(src: dict) -> Optional[str]:
+        return sep.join(_render(spec, src, [])) or None
+    return transform
+
+
+def _emit_value(value: object, buf: list[str]) -> bool:
+    """Append a scalar value to a token buffer."""
+    buf.append(str(value))
+    return True
+
+
+def _emit_despaced(value: str, buf: list[str]) -> bool:
+    """Append a snake_case value, as readable words, to a token buffer."""
+    buf.append(_despace(value))
+    return True
+
+
+def _emit_fields(spec: tuple, sep: str) -> Callable[[dict, list[str]], bool]:
+    """Build an emitter appending the fields of a nested object to a token buffer, separated by ``sep``."""
+    def emit(src: dict, buf: list[str]) -> bool:
+        start = len(buf)
+        for key, template, transform in spec:
+            value = src.get(key)
+            if value is not None and transform is not None:
+                value = transform(value)
+            if value is not None:
+                if len(buf) > start:
+                    buf.append(sep)
+                buf.append(template.format(value))
+        return len(buf) > start
+    return emit
+
+
+def _emit_items(spec: tuple, sep: str, item_sep: str = ", ") -> Callable[[list, list[str]], bool]:
+    """Build an emitter appending each object of a list to a token buffer, skipping empty ones."""
+    emit_item = _emit_fields(spec, sep)
+
+    def emit(items: list, buf: list[str]) -> bool:
+        start = len(buf)
+        for item in items:
+            mark = len(buf)
+            if mark > start:
+                buf.append(item_sep)
+            if not emit_item(item, buf):
+                del buf[mark:]
+        return len(buf) > start
+    return emit
+
+
+def _section_fields(spec: tuple) -> Callable[[dict], list[str]]:
+    """Build a section renderer for a nested JSON object, one token per field."""
+    return lambda src: _render(spec, src, [])
+
+
+def _section_items(spec: tuple) -> Callable[[list], list[str]]:
+    """Build a section renderer for a list of JSON objects, one token per item."""
+    def renderer(items: list) -> list[str]:
+        rendered = ("".join(_render(spec, item, [])) for item in items)
+        return [r for r in rendered if r]
+    return renderer
 
-    return "\n".join(parts)
 
+def _section_value(transform: Callable[[str], str]) -> Callable[[str], list[str]]:
+    """Build a section renderer for a single scalar value."""
+    return lambda value: [transform(value)]
 
-def _build_photography_prompt(prompt_json: dict) -> list[str]:
-    """Build prompt for photography domain."""
-    parts = []
 
+def _iter_sections(sections: tuple, src: dict) -> Iterator[_Section]:
+    """
+    Yield prompt sections of a JSON object using a declarative spec.
+
+    Each section entry is ``(key, label, sep, renderer)``; ``renderer`` turns
+    the value under ``key`` into a list of tokens which are later joined with
+    ``sep`` after ``label``. Missing keys and sections without tokens are skipped.
+
+    Args:
+        sections: Tuple of (key, label, sep, renderer) entries, in output order
+        src: JSON object to read the sections from
+
+    Yields:
+        ``(label, sep, tokens)`` tuples
+    """
+    for key, label, sep, renderer in sections:
+        value = src.get(key)
+        if value is not None:
+            tokens = renderer(value)
+            if tokens:
+                yield label, sep, tokens
+
+
+# Photography
+_HAIR_SPEC = (
+    ("color", "{}", _despace),
+    ("style", "{}", _despace),
+)
+
+_CLOTHING_SPEC = (
+    ("color", "{}", None),
+    ("fabric", "{}", None),
+    ("item", "{}", None),
+)
+
+_ACCESSORY_SPEC = (
+    ("material", "{}", None),
+    ("color", "{}", None),
+    ("item", "{}", None),
+)
+
+# Subject entries are (key, prefix, emitter, suffix); see _render_subject
+_SUBJECT_FIELDS = (
+    ("name", "", _emit_value, ""),
+    ("type", "(", _emit_value, ")"),
+    ("description", "", _emit_value, ""),
+    ("age", ", ", _emit_value, ""),
+    ("gender", ", ", _emit_value, ""),
+    ("hair", ", ", _emit_fields(_HAIR_SPEC, " "), " hair"),
+    ("pose", ", ", _emit_value, ""),
+    ("expression", ", ", _emit_value, " expression"),
+    ("position", ", positioned ", _emit_despaced, ""),
+    ("clothing", ", wearing ", _emit_items(_CLOTHING_SPEC, " "), ""),
+    ("accessories", ", with ", _emit_items(_ACCESSORY_SPEC, " "), ""),
+)
+
+
+def _render_subject(subj: dict) -> str:
+    """Describe one subject; every fragment goes into one flat buffer that is joined once."""
+    buf: list[str] = []
+    for key, prefix, emit, suffix in _SUBJECT_FIELDS:
+        value = subj.get(key)
+        if value is None:
+            continue
+        mark = len(buf)
+        buf.append(prefix)
+        if emit(value, buf):
+            buf.append(suffix)
+        else:
+            del buf[mark:]
+    return "".join(buf)
+
+
+_LIGHTING_SPEC = (
+    ("type", "{}", _despace),
+    ("direction", "{}", _despace),
+)
+
+_SCENE_SPEC = (
+    ("location", "Location: {}", None),
+    ("time", "Time: {}", _despace),
+    ("weather", "Weather: {}", _despace),
+    ("lighting", "Lighting: {}", _join_fields(_LIGHTING_SPEC)),
+    ("background_elements", "Background: {}", ", ".join),
+)
+
+_TECHNICAL_SPEC = (
+    ("camera_model", "Shot on {}", None),
+    ("lens", "{} lens", None),
+    ("aperture", "{}", None),
+    ("film_stock", "{} film look", None),
+)
+
+_COMPOSITION_SPEC = (
+    ("framing", "{}", _despace),
+    ("angle", "{} angle", _despace),
+    ("focus_point", "focus on {}", _despace),
+)
+
+_TEXT_RENDERING_SPEC = (
+    ("text_content", 'text "{}"', None),
+    ("placement", "as {}", _despace),
+    ("font_style", "in {} style", _despace),
+    ("color", "colored {}", None),
+)
+
+
+def _text_rendering_tokens(text: dict) -> list[str]:
+    """Render the text_rendering section, only when it is enabled."""
+    if not text.get("enabled"):
+        return []
+    return _render(_TEXT_RENDERING_SPEC, text, [])
+
+
+_PHOTOGRAPHY_SECTIONS = (
+    ("scene", "Scene", "; ", _section_fields(_SCENE_SPEC)),
+    ("technical", "Technical", ", ", _section_fields(_TECHNICAL_SPEC)),
+    ("composition", "Composition", ", ", _section_fields(_COMPOSITION_SPEC)),
+    ("text_rendering", "Text", " ", _text_rendering_tokens),
+)
+
+# Graphic design
+_GD_LAYOUT_SPEC = (
+    ("grid_system", "{}", _despace),
+    ("alignment", "{}", _despace),
+    ("spacing", "{}", _despace),
+    ("balance", "{}", _despace),
+)
+
+_GD_HIERARCHY_SPEC = (
+    ("primary_focus", "focus on {}", _despace),
+    ("visual_flow", "{} flow", _despace),
+)
+
+_GD_COLOR_SPEC = (
+    ("palette_type", "{}", _despace),
+    ("primary_color", "primary {}", _despace),
+    ("secondary_color", "secondary {}", _despace),
+    ("accent_color", "accent {}", _despace),
+)
+
+_GD_TYPOGRAPHY_SPEC = (
+    ("headline_font", "headline: {}", _despace),
+    ("body_font", "body: {}", _despace),
+)
+
+_GD_ELEMENT_SPEC = (
+    ("type", "{}", _despace),
+    ("content", " '{}'", None),
+    ("style", " ({})", _despace),
+    ("placement", " [{}]", _despace),
+)
+
+_GD_VISUAL_STYLE_SPEC = (
+    ("mood", "{}", None),
+    ("texture", "{}", _despace),
+    ("effects", "{}", _despace_unless_none),
+)
+
+_GRAPHIC_DESIGN_SECTIONS = (
+    ("design_type", "Design", ", ", _section_value(_despace)),
+    ("layout", "Layout", ", ", _section_fields(_GD_LAYOUT_SPEC)),
+    ("hierarchy", "Hierarchy", ", ", _section_fields(_GD_HIERARCHY_SPEC)),
+    ("color_scheme", "Colors", ", ", _section_fields(_GD_COLOR_SPEC)),
+    ("typography", "Typography", ", ", _section_fields(_GD_TYPOGRAPHY_SPEC)),
+    ("elements", "Elements", ", ", _section_items(_GD_ELEMENT_SPEC)),
+    ("visual_style", "Style", ", ", _section_fields(_GD_VISUAL_STYLE_SPEC)),
+)
+
+# UI design
+_UI_LAYOUT_SPEC = (
+    ("structure", "{}", _despace),
+    ("columns", "{} columns", None),
+    ("spacing", "{}", _despace),
+)
+
+_UI_COMPONENT_SPEC = (
+    ("type", "{}", _despace),
+    ("variant", " ({})", None),
+    ("state", " [{}]", _unless_default),
+    ("size", " size: {}", None),
+    ("style", " style: {}", _despace),
+)
+
+_UI_COLOR_SPEC = (
+    ("mode", "{}", _despace),
+    ("primary", "primary {}", None),
+)
+
+_UI_TYPOGRAPHY_SPEC = (
+    ("scale", "{}", _despace),
+    ("font_family", "{}", _despace),
+)
+
+_UI_INTERACTION_SPEC = (
+    ("hover_effect", "hover: {}", _despace_unless_none),
+    ("focus_style", "focus: {}", _despace_unless_none),
+)
+
+_UI_STYLING_SPEC = (
+    ("border_radius", "radius: {}", _despace),
+    ("shadow", "{}", _despace_unless_none),
+)
+
+_UI_ICONOGRAPHY_SPEC = (
+    ("style", "{}", None),
+    ("size", "{} size", None),
+)
+
+_UI_DESIGN_SECTIONS = (
+    ("component_type", "UI Component", ", ", _section_value(_despace)),
+    ("layout", "Layout", ", ", _section_fields(_UI_LAYOUT_SPEC)),
+    ("components", "Components", ", ", _section_items(_UI_COMPONENT_SPEC)),
+    ("color_system", "Colors", ", ", _section_fields(_UI_COLOR_SPEC)),
+    ("typography_system", "Typography", ", ", _section_fields(_UI_TYPOGRAPHY_SPEC)),
+    ("interaction_states", "Interactions", ", ", _section_fields(_UI_INTERACTION_SPEC)),
+    ("styling", "Styling", ", ", _section_fields(_UI_STYLING_SPEC)),
+    ("iconography", "Icons", ", ", _section_fields(_UI_ICONOGRAPHY_SPEC)),
+    ("design_system", "Design System", ", ", _section_value(_despace)),
+)
+
+# Shared by all domains
+_STYLE_MODIFIERS_SPEC = (
+    ("medium", "{}", _despace),
+    ("aesthetic", "{}", _join_despaced),
+    ("artist_reference", "in the style of {}", ", ".join),
+)
+
+_INTENT_SECTIONS = (
+    ("user_intent", None, "", _section_value(str)),
+)
+
+_META_SECTIONS = (
+    ("quality", "Style", "", _section_value(_despace)),
+)
+
+_STYLE_MODIFIERS_SECTIONS = (
+    ("style_modifiers", "Style", ", ", _section_fields(_STYLE_MODIFIERS_SPEC)),
+)
+
+
+def _build_photography_prompt(prompt_json: dict) -> Iterator[_Section]:
+    """Yield prompt sections for photography domain."""
     # Subject descriptions
-    if "subject" in prompt_json:
-        for idx, subj in enumerate(prompt_json["subject"]):
-            subj_desc = []
-
-            if "name" in subj:
-                subj_desc.append(subj["name"])
-
-            if "type" in subj:
-                subj_desc.append(f"({subj['type']})")
-
-            if "description" in subj:
-                subj_desc.append(subj["description"])
-
-            if "age" in subj:
-                subj_desc.append(f", {subj['age']}")
-
-            if "gender" in subj:
-                subj_desc.append(f", {subj['gender']}")
-
-            if "hair" in subj:
-                hair = subj["hair"]
-                hair_desc = []
-                if "color" in hair:
-                    hair_desc.append(hair["color"].replace("_", " "))
-                if "style" in hair:
-                    hair_desc.append(hair["style"].replace("_", " "))
-                if hair_desc:
-                    subj_desc.append(f", {' '.join(hair_desc)} hair")
-
-            if "pose" in subj:
-                subj_desc.append(f", {subj['pose']}")
-
-            if "expression" in subj:
-                subj_desc.append(f", {subj['expression']} expression")
-
-            if "position" in subj:
-                subj_desc.append(f", positioned {subj['position'].replace('_', ' ')}")
-
-            # Clothing
-            if "clothing" in subj:
-                clothes = []
-                for item in subj["clothing"]:
-                    cloth_desc = []
-                    if "color" in item:
-                        cloth_desc.append(item["color"])
-                    if "fabric" in item:
-                        cloth_desc.append(item["fabric"])
-                    if "item" in item:
-                        cloth_desc.append(item["item"])
-                    if cloth_desc:
-                        clothes.append(" ".join(cloth_desc))
-                if clothes:
-                    subj_desc.append(f", wearing {', '.join(clothes)}")
-
-            # Accessories
-            if "accessories" in subj:
-                accs = []
-                for acc in subj["accessories"]:
-                    acc_desc = []
-                    if "material" in acc:
-                        acc_desc.append(acc["material"])
-                    if "color" in acc:
-                        acc_desc.append(acc["color"])
-                    if "item" in acc:
-                        acc_desc.append(acc["item"])
-                    if acc_desc:
-                        accs.append(" ".join(acc_desc))
-                if accs:
-                    subj_desc.append(f", with {', '.join(accs)}")
-
-            if subj_desc:
-                parts.append(f"Subject {idx + 1}: " + "".join(subj_desc))
-
-    # Scene description
-    if "scene" in prompt_json:
-        scene = prompt_json["scene"]
-        scene_desc = []
-
-        if "location" in scene:
-            scene_desc.append(f"Location: {scene['location']}")
-
-        if "time" in scene:
-            scene_desc.append(f"Time: {scene['time'].replace('_', ' ')}")
-
-        if "weather" in scene:
-            scene_desc.append(f"Weather: {scene['weather'].replace('_', ' ')}")
-
-        if "lighting" in scene:
-            lighting = scene["lighting"]
-            light_parts = []
-            if "type" in lighting:
-                light_parts.append(lighting["type"].replace("_", " "))
-            if "direction" in lighting:
-                light_parts.append(lighting["direction"].replace("_", " "))
-            if light_parts:
-                scene_desc.append(f"Lighting: {', '.join(light_parts)}")
-
-        if "background_elements" in scene:
-            scene_desc.append(f"Background: {', '.join(scene['background_elements'])}")
-
-        if scene_desc:
-            parts.append("Scene: " + "; ".join(scene_desc))
-
-    # Technical/Camera settings
-    if "technical" in prompt_json:
-        tech = prompt_json["technical"]
-        tech_desc = []
-
-        if "camera_model" in tech:
-            tech_desc.append(f"Shot on {tech['camera_model']}")
-
-        if "lens" in tech:
-            tech_desc.append(f"{tech['lens']} lens")
-
-        if "aperture" in tech:
-            tech_desc.append(tech["aperture"])
-
-        if "film_stock" in tech:
-            tech_desc.append(f"{tech['film_stock']} film look")
-
-        if tech_desc:
-            parts.append("Technical: " + ", ".join(tech_desc))
-
-    # Composition
-    if "composition" in prompt_json:
-        comp = prompt_json["composition"]
-        comp_desc = []
-
-        if "framing" in comp:
-            comp_desc.append(comp["framing"].replace("_", " "))
-
-        if "angle" in comp:
-            comp_desc.append(f"{comp['angle'].replace('_', ' ')} angle")
-
-        if "focus_point" in comp:
-            comp_desc.append(f"focus on {comp['focus_point'].replace('_', ' ')}")
-
-        if comp_desc:
-            parts.append("Composition: " + ", ".join(comp_desc))
-
-    # Text rendering
-    if "text_rendering" in prompt_json and prompt_json["text_rendering"].get("enabled"):
-        text = prompt_json["text_rendering"]
-        text_desc = []
-
-        if "text_content" in text:
-            text_desc.append(f'text "{text["text_content"]}"')
-
-        if "placement" in text:
-            text_desc.append(f"as {text['placement'].replace('_', ' ')}")
-
-        if "font_style" in text:
-            text_desc.append(f"in {text['font_style'].replace('_', ' ')} style")
-
-        if "color" in text:
-            text_desc.append(f"colored {text['color']}")
-
-        if text_desc:
-            parts.append("Text: " + " ".join(text_desc))
-
-    return parts
-
-
-def _build_graphic_design_prompt(prompt_json: dict) -> list[str]:
-    """Build prompt for graphic design domain."""
-    parts = []
-
-    if "graphic_design" not in prompt_json:
-        return parts
-
-    gd = prompt_json["graphic_design"]
-
-    # Design type
-    if "design_type" in gd:
-        parts.append(f"Design: {gd['design_type'].replace('_', ' ')}")
-
-    # Layout
-    if "layout" in gd:
-        layout = gd["layout"]
-        layout_desc = []
-        if "grid_system" in layout:
-            layout_desc.append(layout["grid_system"].replace("_", " "))
-        if "alignment" in layout:
-            layout_desc.append(layout["alignment"].replace("_", " "))
-        if "spacing" in layout:
-            layout_desc.append(layout["spacing"].replace("_", " "))
-        if "balance" in layout:
-            layout_desc.append(layout["balance"].replace("_", " "))
-        if layout_desc:
-            parts.append(f"Layout: {', '.join(layout_desc)}")
-
-    # Hierarchy
-    if "hierarchy" in gd:
-        hierarchy = gd["hierarchy"]
-        hierarchy_desc = []
-        if "primary_focus" in hierarchy:
-            hierarchy_desc.append(f"focus on {hierarchy['primary_focus'].replace('_', ' ')}")
-        if "visual_flow" in hierarchy:
-            hierarchy_desc.append(f"{hierarchy['visual_flow'].replace('_', ' ')} flow")
-        if hierarchy_desc:
-            parts.append(f"Hierarchy: {', '.join(hierarchy_desc)}")
-
-    # Color scheme
-    if "color_scheme" in gd:
-        colors = gd["color_scheme"]
-        color_desc = []
-        if "palette_type" in colors:
-            color_desc.append(colors["palette_type"].replace("_", " "))
-        if "primary_color" in colors:
-            color_desc.append(f"primary {colors['primary_color'].replace('_', ' ')}")
-        if "secondary_color" in colors:
-            color_desc.append(f"secondary {colors['secondary_color'].replace('_', ' ')}")
-        if "accent_color" in colors:
-            color_desc.append(f"accent {colors['accent_color'].replace('_', ' ')}")
-        if color_desc:
-            parts.append(f"Colors: {', '.join(color_desc)}")
-
-    # Typography
-    if "typography" in gd:
-        typo = gd["typography"]
-        typo_desc = []
-        if "headline_font" in typo:
-            typo_desc.append(f"headline: {typo['headline_font'].replace('_', ' ')}")
-        if "body_font" in typo:
-            typo_desc.append(f"body: {typo['body_font'].replace('_', ' ')}")
-        if typo_desc:
-            parts.append(f"Typography: {', '.join(typo_desc)}")
-
-    # Elements
-    if "elements" in gd:
-        elements_desc = []
-        for elem in gd["elements"]:
-            elem_desc = f"{elem['type'].replace('_', ' ')}"
-            if "content" in elem:
-                elem_desc += f" '{elem['content']}'"
-            if "style" in elem:
-                elem_desc += f" ({elem['style'].replace('_', ' ')})"
-            if "placement" in elem:
-                elem_desc += f" [{elem['placement'].replace('_', ' ')}]"
-            elements_desc.append(elem_desc)
-        if elements_desc:
-            parts.append(f"Elements: {', '.join(elements_desc)}")
-
-    # Visual style
-    if "visual_style" in gd:
-        style = gd["visual_style"]
-        style_desc = []
-        if "mood" in style:
-            style_desc.append(style["mood"])
-        if "texture" in style:
-            style_desc.append(style["texture"].replace("_", " "))
-        if "effects" in style and style["effects"] != "none":
-            style_desc.append(style["effects"].replace("_", " "))
-        if style_desc:
-            parts.append(f"Style: {', '.join(style_desc)}")
-
-    return parts
-
-
-def _build_ui_design_prompt(prompt_json: dict) -> list[str]:
-    """Build prompt for UI design domain."""
-    parts = []
-
-    if "ui_design" not in prompt_json:
-        return parts
-
-    ui = prompt_json["ui_design"]
-
-    # Component type
-    if "component_type" in ui:
-        parts.append(f"UI Component: {ui['component_type'].replace('_', ' ')}")
-
-    # Layout
-    if "layout" in ui:
-        layout = ui["layout"]
-        layout_desc = []
-        if "structure" in layout:
-            layout_desc.append(layout["structure"].replace("_", " "))
-        if "columns" in layout:
-            layout_desc.append(f"{layout['columns']} columns")
-        if "spacing" in layout:
-            layout_desc.append(layout["spacing"].replace("_", " "))
-        if layout_desc:
-            parts.append(f"Layout: {', '.join(layout_desc)}")
-
-    # Components
-    if "components" in ui:
-        comp_desc = []
-        for comp in ui["components"]:
-            c = f"{comp['type'].replace('_', ' ')}"
-            if "variant" in comp:
-                c += f" ({comp['variant']})"
-            if "state" in comp and comp["state"] != "default":
-                c += f" [{comp['state']}]"
-            if "size" in comp:
-                c += f" size: {comp['size']}"
-            if "style" in comp:
-                c += f" style: {comp['style'].replace('_', ' ')}"
-            comp_desc.append(c)
-        if comp_desc:
-            parts.append(f"Components: {', '.join(comp_desc)}")
-
-    # Color system
-    if "color_system" in ui:
-        colors = ui["color_system"]
-        color_desc = []
-        if "mode" in colors:
-            color_desc.append(colors["mode"].replace("_", " "))
-        if "primary" in colors:
-            color_desc.append(f"primary {colors['primary']}")
-        if color_desc:
-            parts.append(f"Colors: {', '.join(color_desc)}")
-
-    # Typography system
-    if "typography_system" in ui:
-        typo = ui["typography_system"]
-        typo_desc = []
-        if "scale" in typo:
-            typo_desc.append(typo["scale"].replace("_", " "))
-        if "font_family" in typo:
-            typo_desc.append(typo["font_family"].replace("_", " "))
-        if typo_desc:
-            parts.append(f"Typography: {', '.join(typo_desc)}")
-
-    # Interaction states
-    if "interaction_states" in ui:
-        states = ui["interaction_states"]
-        states_desc = []
-        if "hover_effect" in states and states["hover_effect"] != "none":
-            states_desc.append(f"hover: {states['hover_effect'].replace('_', ' ')}")
-        if "focus_style" in states and states["focus_style"] != "none":
-            states_desc.append(f"focus: {states['focus_style'].replace('_', ' ')}")
-        if states_desc:
-            parts.append(f"Interactions: {', '.join(states_desc)}")
-
-    # Styling
-    if "styling" in ui:
-        styling = ui["styling"]
-        style_desc = []
-        if "border_radius" in styling:
-            style_desc.append(f"radius: {styling['border_radius'].replace('_', ' ')}")
-        if "shadow" in styling and styling["shadow"] != "none":
-            style_desc.append(styling["shadow"].replace("_", " "))
-        if style_desc:
-            parts.append(f"Styling: {', '.join(style_desc)}")
-
-    # Iconography
-    if "iconography" in ui:
-        icons = ui["iconography"]
-        icon_desc = []
-        if "style" in icons:
-            icon_desc.append(icons["style"])
-        if "size" in icons:
-            icon_desc.append(f"{icons['size']} size")
-        if icon_desc:
-            parts.append(f"Icons: {', '.join(icon_desc)}")
-
-    # Design system reference
-    if "design_system" in ui:
-        parts.append(f"Design System: {ui['design_system'].replace('_', ' ')}")
-
-    return parts
-
-
-def _build_style_modifiers(style_modifiers: dict) -> str:
-    """Build style modifiers string (shared by all domains)."""
-    style_desc = []
-
-    if "medium" in style_modifiers:
-        style_desc.append(style_modifiers["medium"].replace("_", " "))
-
-    if "aesthetic" in style_modifiers:
-        aesthetics = [a.replace("_", " ") for a in style_modifiers["aesthetic"]]
-        style_desc.append(", ".join(aesthetics))
-
-    if "artist_reference" in style_modifiers:
-        style_desc.append(f"in the style of {', '.join(style_modifiers['artist_reference'])}")
-
-    if style_desc:
-        return "Style: " + ", ".join(style_desc)
-    return ""
+    for idx, subj in enumerate(prompt_json.get("subject", ())):
+        subj_desc = _render_subject(subj)
+        if subj_desc:
+            yield f"Subject {idx + 1}", "", [subj_desc]
+
+    # Scene, technical/camera settings, composition and text rendering
+    yield from _iter_sections(_PHOTOGRAPHY_SECTIONS, prompt_json)
+
+
+def _build_graphic_design_prompt(prompt_json: dict) -> Iterator[_Section]:
+    """Yield prompt sections for graphic design domain."""
+    return _iter_sections(_GRAPHIC_DESIGN_SECTIONS, prompt_json.get("graphic_design", {}))
+
+
+def _build_ui_design_prompt(prompt_json: dict) -> Iterator[_Section]:
+    """Yield prompt sections for UI design domain."""
+    return _iter_sections(_UI_DESIGN_SECTIONS, prompt_json.get("ui_design", {}))
+
+
+_DOMAIN_BUILDERS: dict[str, Callable[[dict], Iterator[_Section]]] = {
+    "graphic_design": _build_graphic_design_prompt,
+    "ui_design": _build_ui_design_prompt,
+}
+
+_NEGATIVE_AUGMENTERS: dict[str, Callable[[dict], tuple[str, ...]]] = {
+    "ui_design": lambda meta: _UI_EXCLUDES,
+    "graphic_design": lambda meta: _GD_ILLUSTRATION_EXCLUDES if meta.get("quality") in _ILLUSTRATION_QUALITIES else (),
+}
+
+
+# File extensions for image mime types that can be written to disk as-is
+_MIME_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/webp": "webp",
+}
+
+
+def _save_output_file(output_path: Path, timestamp: str, ext: str, write: Callable[[Path], None]) -> Path:
+    """
+    Write a new output file without ever exposing it incomplete, and return its path.
+
+    The image is first written to a uniquely named hidden .part file, then
+    hard-linked to generated_<timestamp>.<ext>, or generated_<timestamp>_<n>.<ext>
+    when that name is taken (several images saved within the same second,
+    e.g. in batch mode). Linking fails instead of overwriting an existing
+    file, and the final name only appears once the image is complete, so
+    nothing is left behind when writing fails.
+
+    On filesystems without hard links (vfat/exFAT, many SMB/FUSE mounts) the
+    final name is instead reserved as an empty file and the .part file is
+    renamed over it with os.replace.
+
+    Args:
+        output_path: Directory to save the file in
+        timestamp: Timestamp used in the file name
+        ext: File extension
+        write: Callable writing the image to the path it is given
+
+    Returns:
+        Path of the saved file
+    """
+    # Created exclusively like mkstemp, but with the usual umask-based permissions
+    while True:
+        tmp = output_path / f".generated_{timestamp}_{secrets.token_hex(8)}.part"
+        try:
+            os.close(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            break
+        except FileExistsError:
+            continue
+    try:
+        write(tmp)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    # From here on the .part file holds a complete image and is only removed
+    # once it is available under its final name
+    use_link = True
+    n = 0
+    while True:
+        suffix = f"_{n}" if n else ""
+        filepath = output_path / f"generated_{timestamp}{suffix}.{ext}"
+        if use_link:
+            try:
+                os.link(tmp, filepath)
+            except FileExistsError:
+                n += 1
+                continue
+            except OSError:
+                use_link = False
+                continue
+            tmp.unlink(missing_ok=True)
+            return filepath
+
+        try:
+            os.close(os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            n += 1
+            continue
+        try:
+            os.replace(tmp, filepath)
+        except BaseException:
+            filepath.unlink(missing_ok=True)
+            raise
+        return filepath
+
+
+def _print_lines(lines: list[str]) -> None:
+    """Print lines with a single stdout write, so concurrent batch output does not interleave."""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+@functools.lru_cache(maxsize=32)
+def _build_config(
+    aspect_ratio: Optional[str],
+    image_size: Optional[str],
+    cached_content: Optional[str]
+) -> types.GenerateContentConfig:
+    """
+    Build the generation config for one (aspect_ratio, image_size, cached_content) combination.
+
+    Batch prompts almost always share these settings, so the config objects
+    are memoized instead of being rebuilt for every request. They must be
+    treated as read-only.
+    """
+    _, types = _import_genai()
+    image_config_kwargs = {}
+    if aspect_ratio is not None:
+        image_config_kwargs["aspect_ratio"] = aspect_ratio
+    if image_size is not None:
+        image_config_kwargs["image_size"] = image_size
+
+    return types.GenerateContentConfig(
+        response_modalities=["TEXT", "IMAGE"],
+        image_config=types.ImageConfig(**image_config_kwargs) if image_config_kwargs else None,
+        tools=None if cached_content else [_GOOGLE_SEARCH_TOOL],
+        cached_content=cached_content
+    )
+
+
+def _make_output_dir(output_dir: str) -> Optional[Path]:
+    """Create the output directory if needed; returns its path, or None (after reporting) if that fails."""
+    output_path = Path(output_dir)
+    try:
+        output_path.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f"Error: Cannot create output directory {output_dir}: {e}")
+        return None
+    return output_path
+
+
+def _build_request(
+    prompt_json: dict,
+    input_images: Optional[list[types.Part]],
+    cached_content: Optional[str]
+) -> tuple[str, list, types.GenerateContentConfig]:
+    """Build the model name, contents and config of a generation request (shared by sync and async paths)."""
+    # Build text prompt from JSON
+    prompt_text = build_prompt_text(prompt_json)
+
+    # Build content list
+    contents: list = []
+
+    # Add input images for image-to-image generation, unless they are cached
+    if input_images and not cached_content:
+        contents.extend(input_images)
+    contents.append(prompt_text)
+
+    # Extract configuration from JSON; image size (resolution) is 1K, 2K, or 4K (default: 2K)
+    meta = prompt_json.get("meta", {})
+    config = _build_config(meta.get("aspect_ratio"), meta.get("image_size", "2K"), cached_content)
+
+    model = _get_model_name()
+
+    _print_lines([
+        f"\n--- Generated Prompt ---\n{prompt_text}\n------------------------\n",
+        f"Generating image with {model}..."
+    ])
+    return model, contents, config
+
+
+def _save_response(response: types.GenerateContentResponse, output_path: Path) -> str:
+    """Save the image of a generation response into output_path (which must exist); returns its path or ""."""
+    # Blocked responses may come without candidates, content or parts
+    candidate = response.candidates[0] if response.candidates else None
+    content = candidate.content if candidate is not None else None
+    parts = (content.parts if content is not None else None) or []
+    image_part = next((p for p in parts if p.inline_data is not None), None)
+    response_text = " ".join(p.text for p in parts if p.text)
+
+    messages = []
+    if response_text:
+        messages.append(f"Model response: {response_text}")
+
+    if image_part is None:
+        reason = candidate.finish_reason if candidate is not None else None
+        if reason is None and response.prompt_feedback is not None:
+            reason = response.prompt_feedback.block_reason
+        reason = getattr(reason, "name", reason)
+        detail = f" (reason: {reason})" if reason and reason != "STOP" else ""
+        messages.append(f"Warning: No image was generated in the response{detail}.")
+        if response_text:
+            messages.append(f"Model only returned text: {response_text}")
+        _print_lines(messages)
+        return ""
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Determine file extension based on mime type
+    ext = _MIME_EXTENSIONS.get(image_part.inline_data.mime_type)
+
+    if ext is not None:
+        # inline_data.data is already encoded image bytes, write them as-is
+        filepath = _save_output_file(output_path, timestamp, ext, lambda tmp: tmp.write_bytes(image_part.inline_data.data))
+    else:
+        # Unknown mime type: let PIL decode it and save as PNG, with light zlib
+        # compression since the model output is already compressed
+        try:
+            from PIL import Image
+        except ImportError:
+            messages.append(f"Error: Pillow package not installed, cannot convert {image_part.inline_data.mime_type} image.")
+            messages.append("Please install with: pip install Pillow")
+            _print_lines(messages)
+            return ""
+        image = Image.open(io.BytesIO(image_part.inline_data.data))
+        filepath = _save_output_file(
+            output_path, timestamp, "png",
+            lambda tmp: image.save(tmp, format="PNG", compress_level=1, optimize=False)
+        )
+
+    messages.append(f"Image saved to: {filepath}")
+    _print_lines(messages)
+    return str(filepath)
+
+
+# Transient API errors that are retried: rate limiting (429) and temporary unavailability (503)
+_RETRY_STATUS_CODES = frozenset({429, 503})
+_RETRY_ATTEMPTS = 5
+_RETRY_MAX_DELAY = 60.0
+
+
+def _retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Get the delay the server asked for before retrying, if any.
+
+    Looks at the Retry-After header, then at the RetryInfo "retryDelay"
+    (e.g. "23s") that Gemini includes in 429 error details.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers else None
+
+    if value is None:
+        details = getattr(exc, "details", None)
+        error = details.get("error") if isinstance(details, dict) else None
+        for detail in (error.get("details") if isinstance(error, dict) else None) or ():
+            delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if isinstance(delay, str) and delay.endswith("s"):
+                value = delay[:-1]
+                break
+
+    try:
+        return min(max(float(value), 0.0), _RETRY_MAX_DELAY) if value is not None else None
+    except ValueError:
+        return None
+
+
+@functools.cache
+def _retry_kwargs() -> dict:
+    """Build the tenacity arguments shared by the sync and async generation calls."""
+    import tenacity  # installed with google-genai
+
+    genai, _ = _import_genai()
+    backoff = tenacity.wait_exponential_jitter(initial=1, max=30)
+
+    def is_transient(exc: BaseException) -> bool:
+        return isinstance(exc, genai.errors.APIError) and exc.code in _RETRY_STATUS_CODES
+
+    def wait(retry_state: tenacity.RetryCallState) -> float:
+        delay = _retry_after_seconds(retry_state.outcome.exception())
+        return backoff(retry_state) if delay is None else delay
+
+    def before_sleep(retry_state: tenacity.RetryCallState) -> None:
+        print(
+            f"Request failed ({retry_state.outcome.exception().code}), retrying in "
+            f"{retry_state.next_action.sleep:.1f}s "
+            f"(attempt {retry_state.attempt_number + 1}/{_RETRY_ATTEMPTS})..."
+        )
+
+    return {
+        "stop": tenacity.stop_after_attempt(_RETRY_ATTEMPTS),
+        "wait": wait,
+        "retry": tenacity.retry_if_exception(is_transient),
+        "before_sleep": before_sleep,
+        "reraise": True,
+    }
+
+
+def _generate_content_with_retry(client: genai.Client, **kwargs) -> types.GenerateContentResponse:
+    """Call client.models.generate_content, retrying 429/503 errors with backoff (honoring Retry-After)."""
+    import tenacity
+
+    return tenacity.Retrying(**_retry_kwargs())(client.models.generate_content, **kwargs)
+
+
+async def _generate_content_with_retry_async(
+    client: genai.Client,
+    limiter: Optional[_RateLimiter] = None,
+    **kwargs
+) -> types.GenerateContentResponse:
+    """
+    Async counterpart of _generate_content_with_retry, using the SDK's async client.
+
+    When a rate limiter is given, every attempt (retries included) waits for it.
+    """
+    import tenacity
+
+    async def attempt(**kwargs) -> types.GenerateContentResponse:
+        if limiter is not None:
+            await limiter.acquire()
+        return await client.aio.models.generate_content(**kwargs)
+
+    return await tenacity.AsyncRetrying(**_retry_kwargs())(attempt, **kwargs)
 
 
 def generate_image(
     client: genai.Client,
     prompt_json: dict,
-    input_images: Optional[list] = None,
-    output_dir: str = "./generation-image"
+    input_images: Optional[list[types.Part]] = None,
+    output_dir: str = "./generation-image",
+    cached_content: Optional[str] = None
 ) -> str:
     """
     Generate image using Gemini 3 Pro Image.
@@ -552,133 +1180,236 @@ def generate_image(
     Args:
         client: Gemini client instance
         prompt_json: Structured JSON prompt
-        input_images: Optional list of PIL Image objects for image-to-image
+        input_images: Optional list of image Parts for image-to-image
         output_dir: Directory to save generated images
+        cached_content: Optional context cache name already holding the input images
 
     Returns:
         Path to the generated image file
     """
-    # Ensure output directory exists
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
+    # Ensure output directory exists before paying for a generation
+    output_path = _make_output_dir(output_dir)
+    if output_path is None:
+        sys.exit(1)
 
-    # Build text prompt from JSON
-    prompt_text = build_prompt_text(prompt_json)
-    print(f"\n--- Generated Prompt ---\n{prompt_text}\n------------------------\n")
+    model, contents, config = _build_request(prompt_json, input_images, cached_content)
 
-    # Build content list
-    contents = []
+    # Generate image
+    try:
+        response = _generate_content_with_retry(
+            client,
+            model=model,
+            contents=contents,
+            config=config
+        )
+    except Exception as e:
+        if cached_content and input_images and _is_stale_cache_error(e):
+            # The cache expired early, was deleted, or belongs to another API key
+            print(f"Warning: Cached input images are unavailable ({e.code}), sending them inline")
+            _forget_cached_inputs(cached_content)
+            return generate_image(client, prompt_json, input_images, output_dir)
+        print(f"Error generating image: {e}")
+        sys.exit(1)
 
-    # Add input images for image-to-image generation
-    if input_images:
-        for img in input_images:
-            contents.append(img)
-        contents.append(prompt_text)
-    else:
-        contents.append(prompt_text)
+    # Process response and save image
+    return _save_response(response, output_path)
 
-    # Extract configuration from JSON
-    meta = prompt_json.get("meta", {})
 
-    # Build image configuration
-    image_config_kwargs = {}
+async def generate_image_async(
+    client: genai.Client,
+    prompt_json: dict,
+    input_images: Optional[list[types.Part]] = None,
+    output_dir: str = "./generation-image",
+    cached_content: Optional[str] = None,
+    limiter: Optional[_RateLimiter] = None
+) -> str:
+    """
+    Generate image using Gemini 3 Pro Image through the SDK's async client.
 
-    # Aspect ratio
-    if "aspect_ratio" in meta:
-        image_config_kwargs["aspect_ratio"] = meta["aspect_ratio"]
+    Unlike generate_image, errors (rendering the prompt, calling the API or
+    saving the image) are reported and return "" instead of exiting, so one
+    failed prompt does not abort the rest of a batch.
 
-    # Image size (resolution): 1K, 2K, or 4K (default: 2K)
-    image_config_kwargs["image_size"] = meta.get("image_size", "2K")
+    Args:
+        client: Gemini client instance
+        prompt_json: Structured JSON prompt
+        input_images: Optional list of image Parts for image-to-image
+        output_dir: Directory to save generated images
+        cached_content: Optional context cache name already holding the input images
+        limiter: Optional rate limiter every request attempt waits for
 
-    # Build generation config
-    config = types.GenerateContentConfig(
-        response_modalities=["TEXT", "IMAGE"],
-        image_config=types.ImageConfig(**image_config_kwargs) if image_config_kwargs else None,
-        tools=[{"google_search": {}}]
-    )
+    Returns:
+        Path to the generated image file, or "" if no image was saved
+    """
+    # Ensure output directory exists before paying for a generation
+    output_path = _make_output_dir(output_dir)
+    if output_path is None:
+        return ""
 
-    # Get model from config (priority: .env > system env > default)
-    model = get_env_value("GEMINI_MODEL", "gemini-3-pro-image-preview")
+    # A prompt that cannot be rendered only fails itself, not the rest of the batch
+    try:
+        model, contents, config = _build_request(prompt_json, input_images, cached_content)
+    except Exception as e:
+        print(f"Error building prompt: {e}")
+        return ""
 
     # Generate image
-    print(f"Generating image with {model}...")
     try:
-        response = client.models.generate_content(
+        response = await _generate_content_with_retry_async(
+            client,
+            limiter,
             model=model,
             contents=contents,
             config=config
         )
     except Exception as e:
+        if cached_content and input_images and _is_stale_cache_error(e):
+            # The cache expired early, was deleted, or belongs to another API key
+            print(f"Warning: Cached input images are unavailable ({e.code}), sending them inline")
+            _forget_cached_inputs(cached_content)
+            return await generate_image_async(client, prompt_json, input_images, output_dir, limiter=limiter)
         print(f"Error generating image: {e}")
-        sys.exit(1)
+        return ""
 
-    # Process response and save image
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    image_saved = False
-    response_text = ""
-
-    for part in response.candidates[0].content.parts:
-        if part.text is not None:
-            response_text = part.text
-            print(f"Model response: {part.text}")
-        elif part.inline_data is not None:
-            # Use the official as_image() method to get PIL Image
-            try:
-                image = part.as_image()
-
-                # Generate filename
-                filename = f"generated_{timestamp}.png"
-                filepath = output_path / filename
-
-                # Save using PIL
-                image.save(str(filepath))
-
-                print(f"Image saved to: {filepath}")
-                image_saved = True
-                return str(filepath)
-            except AttributeError:
-                # Fallback: if as_image() not available, try direct data access
-                # inline_data.data is already bytes, no need to base64 decode
-                image_data = part.inline_data.data
-
-                # Determine file extension based on mime type
-                mime_type = part.inline_data.mime_type
-                ext = "png"
-                if "jpeg" in mime_type or "jpg" in mime_type:
-                    ext = "jpg"
-                elif "webp" in mime_type:
-                    ext = "webp"
-
-                # Generate filename
-                filename = f"generated_{timestamp}.{ext}"
-                filepath = output_path / filename
-
-                with open(filepath, "wb") as f:
-                    f.write(image_data)
-
-                print(f"Image saved to: {filepath}")
-                image_saved = True
-                return str(filepath)
-
-    if not image_saved:
-        print("Warning: No image was generated in the response.")
-        if response_text:
-            print(f"Model only returned text: {response_text}")
+    # Process response and save image off the event loop; a failure here is
+    # reported like an API error so the rest of the batch keeps going
+    try:
+        return await asyncio.to_thread(_save_response, response, output_path)
+    except Exception as e:
+        print(f"Error saving image: {e}")
         return ""
 
-    return ""
 
+class _RateLimiter:
+    """Sliding-window limiter allowing at most ``rate`` acquisitions per ``period`` seconds."""
+
+    def __init__(self, rate: int, period: float = 60.0):
+        self.rate = rate
+        self.period = period
+        self._calls: collections.deque[float] = collections.deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until another call fits in the window, then record it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.rate:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._calls[0]))
+
+
+def _get_int_env_value(key: str, default: int) -> int:
+    """Get a positive integer setting (priority: .env > system env > default)."""
+    value = get_env_value(key)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        print(f"Error: {key} must be a positive integer, got {value!r}.")
+        sys.exit(1)
+    return number
+
+
+async def _generate_images_async(
+    client: genai.Client,
+    prompts: list[dict],
+    input_images: Optional[list[types.Part]],
+    output_dir: str,
+    cached_content: Optional[str]
+) -> list[str]:
+    """Run generate_image_async for every unique prompt, within the concurrency and rate limits."""
+    # Fail once, before any prompt is billed, if the output directory is unusable
+    if _make_output_dir(output_dir) is None:
+        sys.exit(1)
+
+    semaphore = asyncio.Semaphore(_get_int_env_value("GEMINI_CONCURRENCY", 8))
+    limiter = _RateLimiter(_get_int_env_value("GEMINI_RPM", 20))
+
+    async def run_one(prompt: dict) -> str:
+        async with semaphore:
+            return await generate_image_async(client, prompt, input_images, output_dir, cached_content, limiter)
+
+    keys = [_dumps_canonical(prompt) for prompt in prompts]
+    tasks: dict[bytes, asyncio.Task] = {}
+    for key, prompt in zip(keys, prompts):
+        if key not in tasks:
+            tasks[key] = asyncio.create_task(run_one(prompt))
+    await asyncio.gather(*tasks.values())
+    return [tasks[key].result() for key in keys]
+
+
+async def _generate_batch_async(
+    prompts: list[dict],
+    image_paths: Optional[list[str]],
+    output_dir: str,
+    cache_inputs: bool
+) -> list[str]:
+    """Set up the client and input images, then generate a batch, all on one event loop."""
+    # Read the input images while the client is initialized in a worker thread;
+    # blocking the loop in get_client() would keep the reads from starting
+    images_task = asyncio.create_task(load_input_images_async(image_paths)) if image_paths else None
+    client = await asyncio.to_thread(get_client)
+    input_images = await images_task if images_task else None
 
-def main():
+    cached_content = None
+    if cache_inputs and input_images:
+        cached_content = await asyncio.to_thread(get_cached_inputs, client, input_images, _get_model_name())
+
+    return await _generate_images_async(client, prompts, input_images, output_dir, cached_content)
+
+
+def generate_images(
+    client: genai.Client,
+    prompts: list[dict],
+    input_images: Optional[list[types.Part]] = None,
+    output_dir: str = "./generation-image",
+    cached_content: Optional[str] = None
+) -> list[str]:
+    """
+    Generate one image per prompt concurrently, reusing a single client.
+
+    Requests go through the SDK's async client. At most GEMINI_CONCURRENCY
+    (default 8) are in flight, and at most GEMINI_RPM (default 20) start per
+    minute. Identical prompts are only generated once and share the result.
+
+    Args:
+        client: Gemini client instance
+        prompts: List of structured JSON prompts
+        input_images: Optional list of image Parts shared by all prompts
+        output_dir: Directory to save generated images
+        cached_content: Optional context cache name already holding the input images
+
+    Returns:
+        Paths to the generated image files, in prompt order ("" where no image was saved)
+    """
+    return asyncio.run(_generate_images_async(client, prompts, input_images, output_dir, cached_content))
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command line argument parser."""
     parser = argparse.ArgumentParser(
         description="Generate images using Gemini 3 Pro Image API"
     )
 
-    parser.add_argument(
+    prompt_source = parser.add_mutually_exclusive_group(required=True)
+
+    prompt_source.add_argument(
         "--prompt-json",
         type=str,
-        required=True,
-        help="JSON string containing the structured prompt"
+        help="JSON string containing the structured prompt, or an array of prompts for batch generation"
+    )
+
+    prompt_source.add_argument(
+        "--prompt-file",
+        type=str,
+        help="Path to a JSON file containing the structured prompt, or an array of prompts"
     )
 
     parser.add_argument(
@@ -695,29 +1426,86 @@ def main():
         help="Directory to save generated images (default: ./generation-image)"
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--cache-inputs",
+        action="store_true",
+        help="Upload input images once into a Gemini context cache and reuse it across runs"
+    )
+
+    return parser
+
+
+_PARSER = _build_parser()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = _PARSER.parse_args(argv)
 
     # Load prompt JSON
     try:
-        prompt_json = json.loads(args.prompt_json)
-    except json.JSONDecodeError as e:
+        if args.prompt_file:
+            # Both parsers take the raw UTF-8 bytes, skipping the text decoding layer
+            prompt_json = _loads(Path(args.prompt_file).read_bytes())
+        else:
+            prompt_json = _loads(args.prompt_json)
+    except OSError as e:
+        print(f"Error reading prompt file: {e}")
+        sys.exit(1)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        # orjson reports invalid UTF-8 as a JSONDecodeError, the stdlib as a UnicodeDecodeError
         print(f"Error parsing JSON prompt: {e}")
         sys.exit(1)
 
-    # Initialize client
-    client = get_client()
+    # A JSON array means batch generation
+    prompts = prompt_json if isinstance(prompt_json, list) else [prompt_json]
+    if not prompts or not all(isinstance(p, dict) for p in prompts):
+        print("Error: JSON prompt must be an object or a non-empty array of objects.")
+        sys.exit(1)
 
-    # Load input images if provided
-    input_images = None
-    if args.input_images:
-        input_images = load_input_images(args.input_images)
+    for idx, prompt in enumerate(prompts):
+        error = validate_prompt_json(prompt)
+        if error:
+            where = f" #{idx + 1}" if len(prompts) > 1 else ""
+            print(f"Error: Invalid JSON prompt{where}: {error}")
+            sys.exit(1)
+
+    if isinstance(prompt_json, list):
+        results = asyncio.run(_generate_batch_async(
+            prompts=prompts,
+            image_paths=args.input_images,
+            output_dir=args.output_dir,
+            cache_inputs=args.cache_inputs
+        ))
+        # Identical prompts share one request and one file, so count unique ones
+        requested = len(set(map(_dumps_canonical, prompts)))
+        saved = list(dict.fromkeys(r for r in results if r))
+        merged = len(prompts) - requested
+        note = f" ({merged} duplicate prompt{'s' if merged > 1 else ''} merged)" if merged else ""
+        print(f"\nGeneration complete! {len(saved)} of {requested} images saved{note}:")
+        for result in saved:
+            print(f"  {result}")
+        return
+
+    # Initialize client, loading input images (if provided) in the background meanwhile
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        images_future = None
+        if args.input_images:
+            images_future = executor.submit(load_input_images, args.input_images)
+
+        client = get_client()
+        input_images = images_future.result() if images_future else None
+
+    cached_content = None
+    if args.cache_inputs and input_images:
+        cached_content = get_cached_inputs(client, input_images, _get_model_name())
 
     # Generate image
     result = generate_image(
         client=client,
         prompt_json=prompt_json,
         input_images=input_images,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        cached_content=cached_content
     )
 
     if result: